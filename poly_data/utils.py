@@ -1,8 +1,12 @@
 import json
-from poly_utils.google_utils import get_spreadsheet
+from poly_utils.google_utils import get_spreadsheet, records_from_values
+from gspread.utils import absolute_range_name
 import pandas as pd 
 import os
 
+# Market columns that only take a handful of distinct values
+CATEGORICAL_COLS = ['answer1', 'answer2', 'neg_risk', 'param_type', 'multiplier']
+
 def pretty_print(txt, dic):
     print("\n", txt, json.dumps(dic, indent=4))
 
@@ -33,47 +37,47 @@ def get_sheet_df(read_only=None):
         print("No credentials found, falling back to read-only mode")
         spreadsheet = get_spreadsheet(read_only=True)
 
-    wk = spreadsheet.worksheet(sel)
-    df = pd.DataFrame(wk.get_all_records())
-    df = df[df['question'] != ""].reset_index(drop=True)
+    # Fetch all three worksheets in a single batchGet round-trip
+    ranges = [absolute_range_name(name) for name in (sel, all, 'Hyperparameters')]
+    value_ranges = spreadsheet.values_batch_get(ranges)['valueRanges']
+    df, df2, df_p = (records_from_values(vr.get('values', [])) for vr in value_ranges)
+
+    return _parse_markets(df, df2), _parse_hyperparams(df_p)
 
-    wk2 = spreadsheet.worksheet(all)
-    df2 = pd.DataFrame(wk2.get_all_records())
-    df2 = df2[df2['question'] != ""].reset_index(drop=True)
+def _parse_markets(df, df2):
+    """Merge Selected Markets (df) with the extra columns from All Markets (df2)"""
+    df = df[df['question'] != ""].drop_duplicates('question').reset_index(drop=True)
+    df2 = df2[df2['question'] != ""].drop_duplicates('question').reset_index(drop=True)
 
     # 修改這裡：只從 df2 選擇 df 中不存在的欄位（但保留 question 用於合併）
     # 找出 df2 中有但 df 中沒有的欄位
-    cols_to_add = [col for col in df2.columns if col not in df.columns]
+    cols_to_add = df2.columns.difference(df.columns, sort=False).tolist()
     
     # 合併時只添加這些新欄位
-    df2_filtered = df2[['question'] + cols_to_add]
+    df2_filtered = df2[['question', *cols_to_add]]
     
-    result = df.merge(df2_filtered, on='question', how='inner')
-
-    wk_p = spreadsheet.worksheet('Hyperparameters')
-    records = wk_p.get_all_records()
-    hyperparams, current_type = {}, None
-
-    for r in records:
-        # Update current_type only when we have a non-empty type value
-        # Handle both string and NaN values from pandas
-        type_value = r['type']
-        if type_value and str(type_value).strip() and str(type_value) != 'nan':
-            current_type = str(type_value).strip()
-        
-        # Skip rows where we don't have a current_type set
-        if current_type:
-            # Convert numeric values to appropriate types
-            value = r['value']
-            try:
-                # Try to convert to float if it's numeric
-                if isinstance(value, str) and value.replace('.', '').replace('-', '').isdigit():
-                    value = float(value)
-                elif isinstance(value, (int, float)):
-                    value = float(value)
-            except (ValueError, TypeError):
-                pass  # Keep as string if conversion fails
-            
-            hyperparams.setdefault(current_type, {})[r['param']] = value
-
-    return result, hyperparams
+    # Keys are unique after the dedupe above; validate guards against a cartesian blowup
+    result = df.merge(df2_filtered, on='question', how='inner', validate='one_to_one')
+
+    # Low-cardinality text columns are stored as categoricals to keep the frame compact
+    for col in CATEGORICAL_COLS:
+        if col in result.columns:
+            result[col] = result[col].astype('category')
+
+    return result
+
+def _parse_hyperparams(df_p):
+    """Group Hyperparameters rows under the last non-empty 'type' cell above them"""
+    if df_p.empty:
+        return {}
+
+    hp = df_p[['type', 'param', 'value']].copy()
+    types = hp['type'].astype(str).str.strip()
+    hp['type'] = types.mask(types.isin(['', 'nan'])).ffill()
+    hp = hp.dropna(subset=['type'])
+
+    # Numeric values (including '1e5', '+3', padded cells) become floats, anything else is kept as-is
+    numeric = pd.to_numeric(hp['value'].astype(str).str.strip(), errors='coerce').astype(float)
+    hp['value'] = numeric.where(numeric.notna(), hp['value'])
+
+    return {t: dict(zip(g['param'], g['value'])) for t, g in hp.groupby('type', sort=False)}
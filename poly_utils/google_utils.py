@@ -1,5 +1,6 @@
 from google.oauth2.service_account import Credentials
 import gspread
+from gspread.utils import numericise_all
 import os
 import pandas as pd
 import requests
@@ -38,6 +39,21 @@ def get_spreadsheet(read_only=False):
     spreadsheet = client.open_by_url(spreadsheet_url)
     return spreadsheet
 
+def records_from_values(values):
+    """
+    Build a DataFrame from a worksheet's raw values (header row first).
+    
+    Matches what pd.DataFrame(wk.get_all_records()) would give: short rows are
+    padded with blanks and numeric-looking cells are converted to numbers.
+    """
+    if not values:
+        return pd.DataFrame()
+
+    headers = values[0]
+    width = len(headers)
+    rows = [numericise_all(list(row[:width]) + [''] * (width - len(row))) for row in values[1:]]
+    return pd.DataFrame(rows, columns=headers)
+
 class ReadOnlySpreadsheet:
     """Read-only wrapper for Google Sheets using public CSV export"""
     
@@ -56,6 +72,16 @@ class ReadOnlySpreadsheet:
         """Return a read-only worksheet"""
         return ReadOnlyWorksheet(self.sheet_id, title)
 
+    def values_batch_get(self, ranges, params=None):
+        """Mirror gspread's values_batch_get response shape using CSV exports of whole sheets"""
+        value_ranges = []
+        for range_name in ranges:
+            title = range_name.strip("'").replace("''", "'")
+            records = self.worksheet(title).get_all_records()
+            values = [list(records[0].keys())] + [list(r.values()) for r in records] if records else []
+            value_ranges.append({'range': range_name, 'values': values})
+        return {'valueRanges': value_ranges}
+
 class ReadOnlyWorksheet:
     """Read-only worksheet that fetches data via CSV export"""
     
@@ -12,9 +12,11 @@ from dotenv import load_dotenv
 # 重要: 在導入其他模組前先加載環境變數
 load_dotenv()
 
+import numpy as np
 import pandas as pd
 from typing import Tuple, Optional
-from poly_utils.google_utils import get_spreadsheet
+from gspread.utils import ValueRenderOption
+from poly_utils.google_utils import get_spreadsheet, records_from_values
 
 # ============ Configuration ============
 class MarketConfig:
@@ -46,7 +48,10 @@ def load_volatility_markets(spreadsheet) -> pd.DataFrame:
     """
     try:
         vol_sheet = spreadsheet.worksheet('Volatility Markets')
-        vol_df = pd.DataFrame(vol_sheet.get_all_records())
+        # Unformatted values arrive as native numbers, not display strings
+        vol_df = records_from_values(
+            vol_sheet.get_all_values(value_render_option=ValueRenderOption.unformatted)
+        )
         
         # Remove empty rows
         vol_df = vol_df[vol_df['question'] != ''].reset_index(drop=True)
@@ -55,12 +60,13 @@ def load_volatility_markets(spreadsheet) -> pd.DataFrame:
         vol_df['token1'] = vol_df['token1'].astype(str)
         vol_df['token2'] = vol_df['token2'].astype(str)
         
-        # Convert numeric columns
+        # Convert numeric columns; only columns holding blanks or text need parsing
         numeric_cols = ['gm_reward_per_100', 'volatility_sum', 'best_bid', 
                        'best_ask', 'min_size', 'spread']
-        for col in numeric_cols:
-            if col in vol_df.columns:
-                vol_df[col] = pd.to_numeric(vol_df[col], errors='coerce')
+        cols_present = [c for c in numeric_cols if c in vol_df.columns]
+        unparsed = vol_df[cols_present].select_dtypes('object').columns
+        if len(unparsed) > 0:
+            vol_df[unparsed] = vol_df[unparsed].apply(pd.to_numeric, errors='coerce')
         
         print(f"✓ Loaded {len(vol_df)} markets from Volatility Markets sheet")
         return vol_df
@@ -70,39 +76,41 @@ def load_volatility_markets(spreadsheet) -> pd.DataFrame:
         sys.exit(1)
 
 
-def calculate_scores(df: pd.DataFrame, config: MarketConfig) -> pd.DataFrame:
+def select_top_markets(df: pd.DataFrame, config: MarketConfig) -> pd.DataFrame:
     """
-    Calculate selection scores for each market
+    Filter, score and select the top N markets in a single pass
     
     The score prioritizes high rewards and low volatility:
     score = (reward / (volatility + 1)) * 100
-    """
-    df = df.copy()
-    df['score'] = (
-        df['gm_reward_per_100'] / (df['volatility_sum'] + 1) * 100
-    )
-    return df
-
-
-def filter_markets(df: pd.DataFrame, config: MarketConfig) -> pd.DataFrame:
-    """
-    Filter markets based on configured criteria
+    
+    Only markets meeting the configured criteria are scored, and the top N
+    are picked with a partial sort rather than ordering every candidate.
     
     Returns:
-        Filtered and sorted DataFrame
+        Up to config.TOP_N markets with a score column, highest score first
     """
-    filtered = df[
-        (df['gm_reward_per_100'] >= config.MIN_REWARD) &
-        (df['volatility_sum'] < config.MAX_VOLATILITY) &
-        (df['spread'] < config.MAX_SPREAD) &
-        (df['min_size'] <= config.MAX_MIN_SIZE)
-    ].copy()
-    
-    # Sort by score (highest first)
-    filtered = filtered.sort_values('score', ascending=False)
-    
-    print(f"✓ Filtered to {len(filtered)} markets meeting criteria")
-    return filtered
+    reward, volatility, spread, min_size = (
+        df[['gm_reward_per_100', 'volatility_sum', 'spread', 'min_size']].to_numpy().T
+    )
+    mask = (
+        (reward >= config.MIN_REWARD) &
+        (volatility < config.MAX_VOLATILITY) &
+        (spread < config.MAX_SPREAD) &
+        (min_size <= config.MAX_MIN_SIZE)
+    )
+    candidates = np.flatnonzero(mask)
+    print(f"✓ Filtered to {len(candidates)} markets meeting criteria")
+    
+    score = reward[candidates] / (volatility[candidates] + 1) * 100
+    
+    # Partition out the best TOP_N, then order just those
+    if config.TOP_N < len(candidates):
+        top = np.argpartition(-score, config.TOP_N)[:config.TOP_N]
+    else:
+        top = np.arange(len(candidates))
+    top = top[np.argsort(-score[top], kind='stable')]
+    
+    return df.iloc[candidates[top]].assign(score=score[top])
 
 
 def prepare_selected_markets(df: pd.DataFrame, config: MarketConfig) -> pd.DataFrame:
@@ -111,15 +119,14 @@ def prepare_selected_markets(df: pd.DataFrame, config: MarketConfig) -> pd.DataF
     
     Adds required fields: max_size, trade_size, param_type, multiplier
     """
-    df = df.copy()
-    
-    # Add required fields
-    df['max_size'] = df['min_size'].astype(int).astype(str)
-    df['trade_size'] = df['min_size'].astype(int).astype(str)
-    df['param_type'] = config.DEFAULT_PARAM_TYPE
-    df['multiplier'] = config.DEFAULT_MULTIPLIER
-    
-    return df
+    # Add required fields (assign returns a new frame, so no upfront copy)
+    sizes = df['min_size'].astype('int64').astype(str)
+    return df.assign(
+        max_size=sizes,
+        trade_size=sizes,
+        param_type=config.DEFAULT_PARAM_TYPE,
+        multiplier=config.DEFAULT_MULTIPLIER,
+    )
 
 
 def print_market_summary(df: pd.DataFrame, title: str = "Selected Markets"):
@@ -130,74 +137,80 @@ def print_market_summary(df: pd.DataFrame, title: str = "Selected Markets"):
     print(f"{title}")
     print('=' * 80)
     
-    for idx, (_, row) in enumerate(df.iterrows(), 1):
-        # Truncate long questions
-        question = row['question'][:70]
-        if len(row['question']) > 70:
-            question += "..."
-            
+    # Truncate long questions
+    questions = df['question'].astype(str)
+    questions = questions.str.slice(0, 70) + questions.str.len().gt(70).map({True: '...', False: ''})
+    
+    summary = df[['question', 'gm_reward_per_100', 'volatility_sum', 'spread',
+                  'best_bid', 'best_ask', 'min_size', 'score']].assign(question=questions)
+    rows = summary.itertuples(index=False, name=None)
+    for idx, (question, reward, volatility, spread, bid, ask, min_size, score) in enumerate(rows, 1):
         print(f"\n{idx}. {question}")
-        print(f"   Reward: {row['gm_reward_per_100']:.2f} | "
-              f"Volatility: {row['volatility_sum']:.2f} | "
-              f"Spread: {row['spread']:.3f}")
-        print(f"   Bid: {row['best_bid']:.2f} | "
-              f"Ask: {row['best_ask']:.2f} | "
-              f"Min Size: {row['min_size']:.0f}")
-        print(f"   Score: {row['score']:.2f}")
+        print(f"   Reward: {reward:.2f} | "
+              f"Volatility: {volatility:.2f} | "
+              f"Spread: {spread:.3f}")
+        print(f"   Bid: {bid:.2f} | "
+              f"Ask: {ask:.2f} | "
+              f"Min Size: {min_size:.0f}")
+        print(f"   Score: {score:.2f}")
     
     print('=' * 80)
 
 
-def clear_selected_markets(sel_sheet) -> int:
+def clear_selected_markets(sel_sheet, all_values: Optional[list] = None) -> int:
     """
     Clear existing markets from Selected Markets sheet (keep header)
     
+    Args:
+        all_values: Current sheet values, if the caller has already read them
+    
     Returns:
-        Number of rows deleted
+        Number of rows cleared
     """
     try:
-        all_values = sel_sheet.get_all_values()
-        rows_to_delete = len(all_values) - 1  # Exclude header
+        if all_values is None:
+            all_values = sel_sheet.get_all_values()
+        rows_to_clear = len(all_values) - 1  # Exclude header
         
-        if rows_to_delete > 0:
-            sel_sheet.delete_rows(2, len(all_values))
-            print(f"✓ Cleared {rows_to_delete} existing markets")
+        if rows_to_clear > 0:
+            # One values-clear request instead of a structural row delete
+            sel_sheet.batch_clear([f"2:{len(all_values)}"])
+            print(f"✓ Cleared {rows_to_clear} existing markets")
         else:
             print("✓ No existing markets to clear")
             
-        return rows_to_delete
+        return rows_to_clear
         
     except Exception as e:
         print(f"✗ Error clearing Selected Markets: {e}")
         return 0
 
 
-def update_selected_markets(sel_sheet, markets_df: pd.DataFrame) -> bool:
+def update_selected_markets(sel_sheet, markets_df: pd.DataFrame,
+                            headers: Optional[list] = None) -> bool:
     """
     Update Selected Markets sheet with new markets
     
+    All rows are built client-side and written with a single append_rows
+    call; no sheet method is called per market.
+    
+    Args:
+        headers: Sheet header row, if the caller has already read it
+    
     Returns:
         True if successful, False otherwise
     """
     try:
         # Get headers from sheet
-        headers = sel_sheet.row_values(1)
+        if headers is None:
+            headers = sel_sheet.row_values(1)
         
-        # Add each market
-        success_count = 0
-        for _, row in markets_df.iterrows():
-            # Map row values to headers
-            row_values = [str(row.get(h, '')) for h in headers]
-            sel_sheet.append_row(row_values, value_input_option='USER_ENTERED')
-            success_count += 1
-            
-            # Print progress
-            question = row['question'][:60]
-            if len(row['question']) > 60:
-                question += "..."
-            print(f"  → Added: {question}")
+        # Map columns to headers, blank for columns the frame doesn't have
+        aligned = markets_df.reindex(columns=headers).fillna('').astype(str)
+        rows = aligned.to_numpy().tolist()
+        sel_sheet.append_rows(rows, value_input_option='USER_ENTERED')
         
-        print(f"\n✓ Successfully added {success_count} markets to Selected Markets")
+        print(f"\n✓ Successfully added {len(rows)} markets to Selected Markets")
         return True
         
     except Exception as e:
@@ -212,7 +225,7 @@ def main():
     Main execution function
     
     1. Load Volatility Markets
-    2. Calculate scores and filter
+    2. Filter and score markets
     3. Select top N markets
     4. Update Selected Markets sheet
     """
@@ -241,39 +254,40 @@ def main():
     # 2. Load and process Volatility Markets
     vol_df = load_volatility_markets(spreadsheet)
     
-    # 3. Calculate scores
-    vol_df = calculate_scores(vol_df, config)
+    # 3. Filter, score and select top N (highest score first)
+    top_markets = select_top_markets(vol_df, config)
     
-    # 4. Filter markets
-    filtered_df = filter_markets(vol_df, config)
-    
-    if len(filtered_df) == 0:
+    if len(top_markets) == 0:
         print("\n✗ No markets meet the filtering criteria!")
         print("Consider relaxing the configuration parameters.")
         sys.exit(1)
     
-    # 5. Select top N
-    top_markets = filtered_df.head(config.TOP_N).copy()
-    
     if len(top_markets) < config.TOP_N:
         print(f"\n⚠ Warning: Only {len(top_markets)} markets available "
               f"(requested {config.TOP_N})")
     
-    # 6. Prepare markets for insertion
+    # 4. Prepare markets for insertion
     top_markets = prepare_selected_markets(top_markets, config)
     
-    # 7. Display summary
+    # 5. Display summary
     print_market_summary(top_markets, f"Top {len(top_markets)} Markets")
     
-    # 8. Update Selected Markets sheet
+    # 6. Update Selected Markets sheet
     print("\nUpdating Selected Markets sheet...")
     sel_sheet = spreadsheet.worksheet('Selected Markets')
     
+    # Read the sheet once; the header row is reused for the append
+    try:
+        all_values = sel_sheet.get_all_values()
+    except Exception as e:
+        print(f"✗ Error reading Selected Markets: {e}")
+        sys.exit(1)
+    
     # Clear existing
-    clear_selected_markets(sel_sheet)
+    clear_selected_markets(sel_sheet, all_values)
     
     # Add new markets
-    success = update_selected_markets(sel_sheet, top_markets)
+    success = update_selected_markets(sel_sheet, top_markets, all_values[0] if all_values else None)
     
     if success:
         print("\n" + "=" * 80)